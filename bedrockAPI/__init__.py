@@ -3,6 +3,8 @@ pass
 """
 
 from .ws import BedrockAPI
+from .cluster import BedrockCluster
+from .chat_commands import ChatCommandRouter
 
 
-__all__ = ["BedrockAPI"]
\ No newline at end of file
+__all__ = ["BedrockAPI", "BedrockCluster", "ChatCommandRouter"]
\ No newline at end of file
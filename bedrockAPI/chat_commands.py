@@ -0,0 +1,274 @@
+import inspect
+import json
+import time
+import types
+import typing
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import bedrockAPI.context as context
+
+
+class ChatCommandError(Exception):
+    """
+    Raised when a chat command is called with missing or badly typed arguments, the message
+    is sent back to the player
+    """
+    pass
+
+
+class ChatCommandContext(context.PlayerMessageContext):
+    """
+    A class representing the Game Context passed to chat command handlers.
+    This class inherits from PlayerMessageContext
+
+    Attributes:
+        _api: the BedrockAPI the message came from
+        _command: the full name of the matched command, e.g., "shop buy"
+        _args: the raw argument tokens after the command name
+
+    Methods:
+        command: returns the matched command name
+        args: returns the raw argument tokens
+        reply: sends a message back to the sender with tellraw
+        run_command: runs a command through the BedrockAPI
+    """
+    def __init__(self, data, api, command, args):
+        super().__init__(data)
+        self._api = api
+        self._command = command
+        self._args = args
+
+    @property
+    def command(self) -> str:
+        return self._command
+
+    @property
+    def args(self) -> List[str]:
+        return self._args
+
+    async def reply(self, message: str):
+        rawtext = json.dumps({"rawtext": [{"text": message}]})
+        return await self._api.run_command(f'tellraw "{self.sender}" {rawtext}')
+
+    async def run_command(self, command: str):
+        return await self._api.run_command(command)
+
+
+def _convertBool(token: str) -> bool:
+    if token.lower() in ("true", "yes", "on", "1"):
+        return True
+    if token.lower() in ("false", "no", "off", "0"):
+        return False
+    raise ValueError(token)
+
+
+class _CommandNode:
+    """
+    A node of the chat command trie, one per command word
+
+    Attributes:
+        children: the next command words keyed by name
+        name: the full command name up to this node
+        handler: the coroutine run when the command ends at this node
+        params: (name, converter, optional) for each positional argument of the handler
+        required: the number of arguments without a default value
+        rest: the converter for the handler's *args, None if it has none
+        cooldown: seconds a player has to wait between uses
+        lastUsed: the monotonic time each player last used the command, keyed by player name, oldest first
+    """
+    __slots__ = ("children", "name", "handler", "params", "required", "rest", "cooldown", "lastUsed")
+
+    def __init__(self, name):
+        self.children: Dict[str, _CommandNode] = {}
+        self.name = name
+        self.handler: Optional[Callable] = None
+        self.params: List[Tuple[str, Callable, bool]] = []
+        self.required = 0
+        self.rest: Optional[Callable] = None
+        self.cooldown = 0.0
+        self.lastUsed: "OrderedDict[str, float]" = OrderedDict()
+
+    @property
+    def usage(self) -> str:
+        params = [f"[{name}]" if optional else f"<{name}>" for name, _, optional in self.params]
+        params += ["[...]"] if self.rest else []
+        return " ".join([self.name, *params])
+
+
+class ChatCommandRouter:
+    """
+    Routes PlayerMessage events starting with a prefix to chat command handlers.
+
+    Commands are stored in a trie of words, so a message is matched by walking its own tokens
+    and the dispatch cost depends on the message length, not on how many commands exist.
+    Handler arguments are parsed from the remaining tokens using their type annotations.
+
+    Creating a router registers it as the api's PlayerMessage handler, so it raises if one is
+    already registered and api.game_event refuses player_message afterwards, use message to
+    handle chat that is not a command.
+
+    Example:
+        router = ChatCommandRouter(api)
+
+        @router.command("shop buy", cooldown=2)
+        async def shop_buy(ctx, item: str, amount: int = 1):
+            await ctx.reply(f"Bought {amount} {item}")
+
+    Params:
+        api: the BedrockAPI to receive messages from
+        prefix: the text a message must start with to be a command
+        msg_types: the PlayerMessage types that can run commands, e.g., chat
+
+    Methods:
+        command: decorator registering a handler for a command path
+        message: decorator registering a handler for messages that are not commands
+        dispatch: routes a PlayerMessageContext, returns True if a command matched
+    """
+    def __init__(self, api, prefix="!", msg_types=("chat",)):
+        self._api = api
+        self._prefix = prefix
+        self._msgTypes = set(msg_types)
+        self._root = _CommandNode("")
+        self._fallback: Optional[Callable] = None
+
+        if "PlayerMessage" in api._gameEvent.event_handlers:
+            raise Exception("A PlayerMessage handler is already registered, "
+                            "register it with router.message instead of api.game_event")
+        api._gameEvent.add_event_handler("PlayerMessage", self.dispatch)
+        api._chatRouter = self
+
+    def command(self, path: str, cooldown=0.0):
+        def decorator(handler):
+            params, required, rest = self._parseSignature(handler)
+
+            node = self._root
+            for word in path.split():
+                if word not in node.children:
+                    node.children[word] = _CommandNode(f"{node.name} {word}".strip())
+                node = node.children[word]
+
+            if node.handler is not None:
+                raise Exception(f"Chat command: {path} is already registered")
+
+            node.handler = handler
+            node.cooldown = cooldown
+            node.params, node.required, node.rest = params, required, rest
+            return handler
+
+        return decorator
+
+    def message(self, handler):
+        self._fallback = handler
+        return handler
+
+    @staticmethod
+    def _converter(handler, name, annotation) -> Callable:
+        if annotation is None:
+            return str
+
+        # Optional[X] is Union[X, None], the default covers the None case
+        if typing.get_origin(annotation) in (Union, getattr(types, "UnionType", Union)):
+            args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+            if len(args) == 1:
+                annotation = args[0]
+
+        if annotation is bool:
+            return _convertBool
+        if typing.get_origin(annotation) is not None or not callable(annotation):
+            raise Exception(f"Chat command: {handler.__name__} argument {name} has an unsupported "
+                            f"annotation {annotation}, use a type that converts a string, e.g., int")
+        return annotation
+
+    @classmethod
+    def _parseSignature(cls, handler):
+        hints = typing.get_type_hints(handler)
+        params = []
+        required = 0
+        rest = None
+        for param in list(inspect.signature(handler).parameters.values())[1:]:
+            if param.kind in (inspect.Parameter.KEYWORD_ONLY, inspect.Parameter.VAR_KEYWORD):
+                raise Exception(f"Chat command: {handler.__name__} argument {param.name} must be positional, "
+                                f"chat arguments are passed by position")
+
+            converter = cls._converter(handler, param.name, hints.get(param.name))
+            if param.kind == inspect.Parameter.VAR_POSITIONAL:
+                rest = converter
+            else:
+                optional = param.default is not inspect.Parameter.empty
+                params.append((param.name, converter, optional))
+                required += not optional
+        return params, required, rest
+
+    def _parseArgs(self, node: _CommandNode, tokens: List[str]):
+        usage = f"{self._prefix}{node.usage}"
+        if len(tokens) < node.required:
+            raise ChatCommandError(f"Missing arguments, usage: {usage}")
+        if len(tokens) > len(node.params) and node.rest is None:
+            raise ChatCommandError(f"Too many arguments, usage: {usage}")
+
+        args = []
+        for (name, converter, _), token in zip(node.params, tokens):
+            try:
+                args.append(converter(token))
+            except (ValueError, TypeError):
+                raise ChatCommandError(f"Invalid value for <{name}>: {token}, usage: {usage}")
+
+        for token in tokens[len(node.params):]:
+            try:
+                args.append(node.rest(token))
+            except (ValueError, TypeError):
+                raise ChatCommandError(f"Invalid value: {token}, usage: {usage}")
+
+        return args
+
+    async def dispatch(self, ctx: context.PlayerMessageContext) -> bool:
+        message = ctx.message
+        if ctx.msg_type not in self._msgTypes or not message.startswith(self._prefix):
+            if self._fallback is not None:
+                await self._fallback(ctx)
+            return False
+
+        tokens = message[len(self._prefix):].split()
+        node = self._root
+        depth = 0
+        for token in tokens:
+            child = node.children.get(token)
+            if child is None:
+                break
+            node = child
+            depth += 1
+
+        if node.handler is None:
+            if self._fallback is not None:
+                await self._fallback(ctx)
+            return False
+
+        commandCtx = ChatCommandContext(ctx.data, self._api, node.name, tokens[depth:])
+        commandCtx._worker = ctx.worker
+        commandCtx._connection = ctx.connection
+
+        try:
+            args = self._parseArgs(node, tokens[depth:])
+        except ChatCommandError as e:
+            await commandCtx.reply(str(e))
+            return True
+
+        if node.cooldown:
+            player = ctx.sender
+            now = time.monotonic()
+            remaining = node.lastUsed.get(player, -node.cooldown) + node.cooldown - now
+            if remaining > 0:
+                await commandCtx.reply(f"You can use {self._prefix}{node.name} again in {remaining:.1f}s")
+                return True
+
+            # uses are kept in time order, so expired ones are dropped from the front
+            lastUsed = node.lastUsed
+            lastUsed.pop(player, None)
+            while lastUsed and next(iter(lastUsed.values())) <= now - node.cooldown:
+                lastUsed.popitem(last=False)
+            lastUsed[player] = now
+
+        await node.handler(commandCtx, *args)
+        return True
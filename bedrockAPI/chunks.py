@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import bedrockAPI.context as context
+
+
+CHUNK_LOADED = "_ChunkLoaded_1.0.2"
+CHUNK_UNLOADED = "_ChunkUnloaded_1.0.2"
+CHUNK_CHANGED = "_ChunkChanged_1.0.2"
+
+chunk_events = [CHUNK_LOADED, CHUNK_UNLOADED, CHUNK_CHANGED]
+
+
+def _chunkKey(x: int, z: int) -> int:
+    # packs both signed 32 bit chunk coordinates into one int, cheaper to hash than a tuple
+    return ((x & 0xFFFFFFFF) << 32) | (z & 0xFFFFFFFF)
+
+
+def _chunkCoords(key: int) -> Tuple[int, int]:
+    x, z = key >> 32, key & 0xFFFFFFFF
+    return x - (1 << 32) if x >= 1 << 31 else x, z - (1 << 32) if z >= 1 << 31 else z
+
+
+class _Bitset:
+    """
+    A growable bitset over chunk slots, backed by a bytearray so setting a bit is constant time
+    """
+    __slots__ = ("_bits",)
+
+    def __init__(self):
+        self._bits = bytearray()
+
+    def set(self, index: int, value: bool):
+        byte = index >> 3
+        if byte >= len(self._bits):
+            if not value:
+                return
+            self._bits.extend(bytes(byte - len(self._bits) + 1))
+        if value:
+            self._bits[byte] |= 1 << (index & 7)
+        else:
+            self._bits[byte] &= ~(1 << (index & 7)) & 0xFF
+
+    def get(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] >> (index & 7) & 1)
+
+    def clear(self):
+        self._bits = bytearray()
+
+    def __iter__(self) -> Iterator[int]:
+        for byte, value in enumerate(self._bits):
+            while value:
+                low = value & -value
+                yield (byte << 3) + low.bit_length() - 1
+                value ^= low
+
+
+class _DimensionChunks:
+    """
+    The chunks of a single dimension, each loaded or dirty chunk holds a slot in the bitsets,
+    slots are freed once a chunk is both unloaded and clean and reused for new chunks
+
+    Attributes:
+        slots: the slot of every tracked chunk, keyed by packed chunk coordinates
+        keys: the packed chunk coordinates of every slot, None for free slots
+        free: the freed slots available for reuse
+        loaded: bitset of the loaded slots
+        dirty: bitset of the slots changed since the last clear_dirty
+        changed: packed chunk coordinates to the version they last changed at, oldest first
+    """
+    __slots__ = ("slots", "keys", "free", "loaded", "dirty", "changed")
+
+    def __init__(self):
+        self.slots: Dict[int, int] = {}
+        self.keys: List[Optional[int]] = []
+        self.free: List[int] = []
+        self.loaded = _Bitset()
+        self.dirty = _Bitset()
+        self.changed: "OrderedDict[int, int]" = OrderedDict()
+
+    def slot(self, key: int) -> int:
+        slot = self.slots.get(key)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.keys[slot] = key
+            else:
+                slot = len(self.keys)
+                self.keys.append(key)
+            self.slots[key] = slot
+        return slot
+
+    def release(self, slot: int):
+        del self.slots[self.keys[slot]]
+        self.keys[slot] = None
+        self.free.append(slot)
+
+
+class ChunkTracker:
+    """
+    Tracks which chunks are loaded and which changed, fed from the _ChunkLoaded, _ChunkUnloaded
+    and _ChunkChanged game events, enabled with BedrockAPI.track_chunks
+
+    Every change bumps a global version, so jobs can remember the version they last scanned at
+    and only revisit the chunks changed since then.
+
+    Attributes:
+        _dimensions: the _DimensionChunks of every dimension seen
+        _version: the number of changes recorded so far
+
+    Methods:
+        version: returns the current version
+        feed: updates the tracker from a chunk event
+        load, unload, change: record a chunk event directly, feed skips events without coordinates
+        is_loaded: returns whether a chunk is loaded
+        loaded: returns the (x, z) of every loaded chunk in a dimension
+        changed_since: returns the (dimension, x, z) of every chunk changed after a version
+        dirty: returns the (x, z) of every chunk changed since the last clear_dirty
+        clear_dirty: resets the dirty chunks of a dimension
+        trim_changed: forgets the changes up to a version that has been consumed
+    """
+    def __init__(self):
+        self._dimensions: Dict[int, _DimensionChunks] = {}
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _dimension(self, dimension: int) -> _DimensionChunks:
+        chunks = self._dimensions.get(dimension)
+        if chunks is None:
+            chunks = self._dimensions[dimension] = _DimensionChunks()
+        return chunks
+
+    def feed(self, eventName: str, ctx: context.ChunkContext):
+        if ctx.x is None or ctx.z is None:
+            return
+        if eventName == CHUNK_LOADED:
+            self.load(ctx.dimension, ctx.x, ctx.z)
+        elif eventName == CHUNK_UNLOADED:
+            self.unload(ctx.dimension, ctx.x, ctx.z)
+        elif eventName == CHUNK_CHANGED:
+            self.change(ctx.dimension, ctx.x, ctx.z)
+
+    def load(self, dimension: int, x: int, z: int):
+        chunks = self._dimension(dimension)
+        chunks.loaded.set(chunks.slot(_chunkKey(x, z)), True)
+
+    def unload(self, dimension: int, x: int, z: int):
+        chunks = self._dimensions.get(dimension)
+        slot = None if chunks is None else chunks.slots.get(_chunkKey(x, z))
+        if slot is None:
+            return
+        chunks.loaded.set(slot, False)
+        if not chunks.dirty.get(slot):
+            chunks.release(slot)
+
+    def change(self, dimension: int, x: int, z: int):
+        self._version += 1
+        chunks = self._dimension(dimension)
+        key = _chunkKey(x, z)
+        chunks.dirty.set(chunks.slot(key), True)
+        chunks.changed[key] = self._version
+        chunks.changed.move_to_end(key)
+
+    def is_loaded(self, dimension: int, x: int, z: int) -> bool:
+        chunks = self._dimensions.get(dimension)
+        if chunks is None:
+            return False
+        slot = chunks.slots.get(_chunkKey(x, z))
+        return slot is not None and chunks.loaded.get(slot)
+
+    def loaded(self, dimension: int) -> List[Tuple[int, int]]:
+        chunks = self._dimensions.get(dimension)
+        if chunks is None:
+            return []
+        return [_chunkCoords(chunks.keys[slot]) for slot in chunks.loaded]
+
+    def changed_since(self, version: int) -> List[Tuple[int, int, int]]:
+        """
+        Walks each dimension's changes from the newest, so the cost depends on how many chunks
+        changed after version rather than on how many chunks are tracked
+        """
+        result = []
+        for dimension, chunks in self._dimensions.items():
+            for key in reversed(chunks.changed):
+                if chunks.changed[key] <= version:
+                    break
+                result.append((dimension, *_chunkCoords(key)))
+        return result
+
+    def dirty(self, dimension: int) -> List[Tuple[int, int]]:
+        chunks = self._dimensions.get(dimension)
+        if chunks is None:
+            return []
+        return [_chunkCoords(chunks.keys[slot]) for slot in chunks.dirty]
+
+    def clear_dirty(self, dimension: int):
+        chunks = self._dimensions.get(dimension)
+        if chunks is None:
+            return
+        for slot in list(chunks.dirty):
+            if not chunks.loaded.get(slot):
+                chunks.release(slot)
+        chunks.dirty.clear()
+
+    def trim_changed(self, version: int):
+        """
+        Drops the changes made at or before version, call it once every job has scanned up to version
+        """
+        for chunks in self._dimensions.values():
+            changed = chunks.changed
+            while changed and next(iter(changed.values())) <= version:
+                changed.popitem(last=False)
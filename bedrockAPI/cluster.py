@@ -0,0 +1,421 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+
+from typing import Callable, Dict, Optional, Set
+from uuid import uuid4
+
+import bedrockAPI.context as context
+
+from bedrockAPI.events import event_connection, event_worker
+from bedrockAPI.ws import BedrockAPI
+
+
+logger = logging.getLogger("bedrockAPI.cluster")
+
+
+class ClusterError(Exception):
+    """
+    Raised when a command routed to another worker fails, times out or targets a worker
+    that is not connected
+    """
+    pass
+
+
+class EventBus:
+    """
+    Local IPC hub that links the worker processes of a BedrockCluster over a Unix socket.
+
+    Every worker connects once and introduces itself with a hello message. Messages are
+    newline delimited json, events and websocket connection changes are broadcast to every
+    other worker and command requests/responses are routed to the worker named in "target".
+    A command for a worker that is not connected gets an error response straight away.
+
+    Writes are not awaited, so a worker that stops reading would make the hub buffer without
+    limit. Once a worker's transport buffer passes high_water bytes, messages to it are
+    dropped and logged, and commands get an error response instead.
+
+    Params:
+        path: the filesystem path of the Unix socket
+        high_water: bytes buffered for a worker before messages to it are dropped
+
+    Attributes:
+        _path: the filesystem path of the Unix socket
+        _highWater: bytes buffered for a worker before messages to it are dropped
+        _writers: the stream writer of every connected worker keyed by worker id
+        _connections: the worker owning every open websocket connection, keyed by connection id
+        _dropping: the workers messages are currently being dropped for
+        _server: the asyncio server accepting worker connections
+
+    Methods:
+        path: returns the socket path
+        start: starts listening on the socket
+        close: closes every worker connection and removes the socket
+    """
+    def __init__(self, path: str, high_water=4 * 1024 * 1024):
+        self._path = path
+        self._highWater = high_water
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._connections: Dict[str, int] = {}
+        self._dropping: Set[int] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def path(self):
+        return self._path
+
+    async def start(self):
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._server = await asyncio.start_unix_server(self._handleWorker, path=self._path)
+
+    @staticmethod
+    def _encode(message: dict) -> bytes:
+        return json.dumps(message).encode() + b"\n"
+
+    def _write(self, target: int, line: bytes) -> bool:
+        writer = self._writers.get(target)
+        if writer is None:
+            return False
+        if writer.transport.get_write_buffer_size() > self._highWater:
+            if target not in self._dropping:
+                self._dropping.add(target)
+                logger.warning(f"Worker {target} is not reading from the event bus, dropping its messages")
+            return False
+        if target in self._dropping:
+            self._dropping.discard(target)
+            logger.warning(f"Worker {target} is reading from the event bus again")
+        writer.write(line)
+        return True
+
+    def _broadcast(self, line: bytes, origin: int):
+        for target in list(self._writers):
+            if target != origin:
+                self._write(target, line)
+
+    def _route(self, worker: int, message: dict, line: bytes):
+        messageType = message["type"]
+
+        if messageType == "connection":
+            if message["connected"]:
+                self._connections[message["connection"]] = worker
+            else:
+                self._connections.pop(message["connection"], None)
+            self._broadcast(line, worker)
+
+        elif messageType == "event":
+            self._broadcast(line, worker)
+
+        elif messageType in ("command", "commandResponse"):
+            if not self._write(message["target"], line) and messageType == "command":
+                self._write(worker, self._encode({
+                    "type": "commandResponse",
+                    "target": worker,
+                    "requestId": message["requestId"],
+                    "error": f"Worker {message['target']} is not connected to the cluster or is not reading"
+                }))
+
+        else:
+            raise ValueError(f"unknown message type {messageType}")
+
+    async def _handleWorker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = None
+        try:
+            hello = json.loads(await reader.readline())
+            worker = hello["worker"]
+            self._writers[worker] = writer
+
+            for connection, owner in self._connections.items():
+                writer.write(self._encode({"type": "connection", "worker": owner,
+                                           "connection": connection, "connected": True}))
+
+            async for line in reader:
+                try:
+                    self._route(worker, json.loads(line), line)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Ignoring malformed event bus message from worker {worker}: {e!r}")
+        except (ConnectionError, json.JSONDecodeError, KeyError):
+            pass
+        finally:
+            if worker is not None:
+                self._writers.pop(worker, None)
+                self._dropping.discard(worker)
+                for connection, owner in list(self._connections.items()):
+                    if owner == worker:
+                        del self._connections[connection]
+                        self._broadcast(self._encode({"type": "connection", "worker": worker,
+                                                      "connection": connection, "connected": False}), worker)
+            writer.close()
+
+    async def close(self):
+        for writer in list(self._writers.values()):
+            writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+class BusClient:
+    """
+    A worker's connection to the EventBus, attached to a BedrockAPI as api._bus.
+
+    Every websocket connection has a cluster wide id and is owned by the worker that accepted
+    it, a worker can own any number of them. Events received from other workers are dispatched
+    with ctx.worker and ctx.connection set to their owner, and run_command calls made by their
+    handlers are routed back to that connection.
+
+    Attributes:
+        _api: the BedrockAPI running in this worker
+        _worker: the id of this worker
+        _path: the socket path of the EventBus
+        _broadcast: whether game events from this worker's clients are sent to the other workers
+        _highWater: bytes buffered for the bus before messages are dropped
+        _writer: the stream writer connected to the EventBus
+        _readTask: the task reading routed messages from the EventBus
+        _dropping: whether messages to the EventBus are currently being dropped
+        _pending: futures for commands routed to other workers keyed by requestId
+        _connections: the worker owning every open websocket connection in the cluster, keyed by connection id
+
+    Methods:
+        worker: returns the worker id
+        broadcast: returns whether game events are broadcast
+        connections: returns the owning worker of every open connection, keyed by connection id
+        connected_workers: returns the ids of the workers that have a client connected
+        connect: connects to the EventBus and starts reading routed messages
+        announce: tells the other workers a connection of this worker opened or closed
+        publish: broadcasts a game event received from one of this worker's clients
+        run_command: runs a command on a client owned by another worker
+    """
+    def __init__(self, api, worker: int, path: str, broadcast=False, high_water=4 * 1024 * 1024):
+        self._api = api
+        self._worker = worker
+        self._path = path
+        self._broadcast = broadcast
+        self._highWater = high_water
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._readTask: Optional[asyncio.Task] = None
+        self._dropping = False
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._connections: Dict[str, int] = {}
+
+    @property
+    def worker(self):
+        return self._worker
+
+    @property
+    def broadcast(self) -> bool:
+        return self._broadcast
+
+    @property
+    def connections(self) -> Dict[str, int]:
+        return dict(self._connections)
+
+    @property
+    def connected_workers(self) -> Set[int]:
+        return set(self._connections.values())
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_unix_connection(self._path)
+        self._send({"type": "hello", "worker": self._worker})
+        self._readTask = asyncio.get_running_loop().create_task(self._read(reader))
+        self._readTask.add_done_callback(self._readerDone)
+
+    @staticmethod
+    def _readerDone(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Event bus reader stopped, routed commands and events are lost",
+                         exc_info=task.exception())
+
+    def _send(self, message: dict) -> bool:
+        if self._writer.transport.get_write_buffer_size() > self._highWater:
+            if not self._dropping:
+                self._dropping = True
+                logger.warning("The event bus is not reading, dropping messages to it")
+            return False
+        if self._dropping:
+            self._dropping = False
+            logger.warning("The event bus is reading again")
+        self._writer.write(json.dumps(message).encode() + b"\n")
+        return True
+
+    def announce(self, connection: str, connected: bool):
+        if connected:
+            self._connections[connection] = self._worker
+        else:
+            self._connections.pop(connection, None)
+        self._send({"type": "connection", "worker": self._worker, "connection": connection, "connected": connected})
+
+    def publish(self, eventName: str, body: dict, connection: str):
+        self._send({"type": "event", "origin": self._worker, "connection": connection,
+                    "eventName": eventName, "body": body})
+
+    async def run_command(self, command: str, worker: int, connection: Optional[str] = None,
+                          timeout=10.0) -> context.CommandResponseContext:
+        requestId = str(uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self._pending[requestId] = future
+        sent = self._send({
+            "type": "command",
+            "origin": self._worker,
+            "target": worker,
+            "connection": connection,
+            "requestId": requestId,
+            "commandLine": command
+        })
+        try:
+            if not sent:
+                raise ClusterError(f"Could not route the command to worker {worker}, the event bus is not reading")
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise ClusterError(f"Command routed to worker {worker} timed out after {timeout}s")
+        finally:
+            self._pending.pop(requestId, None)
+
+    async def _runRouted(self, message: dict):
+        response = {"type": "commandResponse", "target": message["origin"], "requestId": message["requestId"]}
+        try:
+            result = await self._api.run_command(message["commandLine"], worker=self._worker,
+                                                 connection=message.get("connection"))
+            response["body"] = result._data
+        except Exception as e:
+            response["error"] = f"{type(e).__name__}: {e}"
+        self._send(response)
+
+    async def _dispatch(self, eventName: str, gameContext: context.GameContext):
+        # runs in its own task, so the contextvars only route this handler's commands
+        event_worker.set(gameContext.worker)
+        event_connection.set(gameContext.connection)
+        await self._api._gameEvent.trigger_event(eventName, gameContext)
+
+    def _handleMessage(self, message: dict):
+        messageType = message["type"]
+
+        if messageType == "event":
+            eventName = message["eventName"]
+            gameContext = context.getGameContext(eventName)(message["body"])
+            gameContext._worker = message["origin"]
+            gameContext._connection = message.get("connection")
+            self._api._createTask(self._dispatch(eventName, gameContext))
+
+        elif messageType == "connection":
+            if message["connected"]:
+                self._connections[message["connection"]] = message["worker"]
+            else:
+                self._connections.pop(message["connection"], None)
+
+        elif messageType == "command":
+            self._api._createTask(self._runRouted(message))
+
+        elif messageType == "commandResponse":
+            future = self._pending.get(message["requestId"])
+            if future is None or future.done():
+                return
+            if "error" in message:
+                future.set_exception(ClusterError(message["error"]))
+            else:
+                future.set_result(context.CommandResponseContext(message["body"]))
+
+        else:
+            raise ValueError(f"unknown message type {messageType}")
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            async for line in reader:
+                try:
+                    self._handleMessage(json.loads(line))
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Ignoring malformed event bus message: {e!r}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ClusterError("Lost the connection to the cluster event bus"))
+
+
+def _runWorker(worker: int, host: str, port: int, path: str, setup: Callable, broadcast: bool):
+    api = BedrockAPI(host, port, reuse_port=True)
+    api._bus = BusClient(api, worker, path, broadcast)
+    setup(api)
+    api.loop.run_until_complete(api._bus.connect())
+    api.start()
+
+
+class BedrockCluster:
+    """
+    Runs one BedrockAPI per worker process, all listening on the same port with SO_REUSEPORT,
+    so the kernel spreads incoming client connections over every core.
+
+    Game events are handled by the worker whose client sent them, ctx.worker, ctx.connection
+    and api.worker give the ids, and run_command calls made by a handler go back to the
+    connection that sent the event. A worker can own several connections.
+    api.run_command(command, worker=n, connection=c) runs a command on a given client,
+    api.connections maps every open connection id to the worker that owns it.
+
+    With broadcast_events, game events are also dispatched to the handlers of every other
+    worker through the EventBus, so each handler runs once per worker for every event.
+    run_command calls made by those handlers go back to the connection that sent the event,
+    but handlers that reply (e.g. ChatCommandRouter) will reply once per worker, so only
+    enable it for handlers that check ctx.worker == api.worker before replying.
+
+    Params:
+        host, port: the address every worker listens on
+        setup: a module level function called with each worker's BedrockAPI to register handlers
+        workers: the number of worker processes, defaults to the cpu count
+        broadcast_events: dispatch every game event to the handlers of every worker
+
+    Methods:
+        start: starts the EventBus and the workers and blocks until they exit
+        stop: terminates the workers
+    """
+    def __init__(self, setup: Callable, host='localhost', port=8000, workers: Optional[int] = None,
+                 broadcast_events=False):
+        self._setup = setup
+        self._broadcastEvents = broadcast_events
+        self._host = host
+        self._port = port
+        self._workers = workers or os.cpu_count() or 1
+        self._path = os.path.join(tempfile.gettempdir(), f"bedrockAPI-{os.getpid()}.sock")
+        self._processes = []
+
+    def __repr__(self):
+        return f"Bedrock API cluster of {self._workers} workers running at {self._host}:{self._port}"
+
+    def start(self):
+        async def main():
+            bus = EventBus(self._path)
+            await bus.start()
+
+            for worker in range(self._workers):
+                process = multiprocessing.get_context("spawn").Process(
+                    target=_runWorker,
+                    args=(worker, self._host, self._port, self._path, self._setup, self._broadcastEvents),
+                    daemon=True
+                )
+                process.start()
+                self._processes.append(process)
+
+            print('WebSocket Cluster - running at')
+            print(f':: ws://localhost:{self._port} ({self._workers} workers)')
+            print(f':: /connect ws://{self._host}:{self._port}')
+
+            try:
+                while any(process.is_alive() for process in self._processes):
+                    await asyncio.sleep(1)
+            finally:
+                await bus.close()
+
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
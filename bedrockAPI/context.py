@@ -1,7 +1,10 @@
+from typing import Optional
 from uuid import UUID
 import asyncio
 import math
 
+import bedrockAPI.identifiers as identifiers
+
 
 class GameContext:
     """
@@ -10,20 +13,34 @@ class GameContext:
 
     Attributes:
         _data: private variable holding the json data returned from the event
+        _worker: the BedrockCluster worker whose client sent the event, None outside a cluster
+        _connection: the id of the websocket connection that sent the event
 
     Methods:
         data: returns _data as a python object
+        worker: returns the worker whose client sent the event
+        connection: returns the id of the connection that sent the event
 
     Params:
         data: body from the returned subscribe event
     """
     def __init__(self, data: dict):
         self._data = data
+        self._worker = None
+        self._connection = None
 
     @property
     def data(self) -> dict:
         return self._data
 
+    @property
+    def worker(self):
+        return self._worker
+
+    @property
+    def connection(self):
+        return self._connection
+
 
 class CommandResponseContext:
     """
@@ -146,6 +163,7 @@ class Enchantment:
         name: The name of the enchant as it appears in game
         type: The int value representing a specific enchantment
         level: The level of the enchant
+        _nameIndex: the interned id of the name in identifiers.enchantments, None if the registry is full
 
     Methods:
         name: returns name
@@ -153,7 +171,7 @@ class Enchantment:
         level: returns level
     """
     def __init__(self, data):
-        self._name = data["name"]
+        self._nameIndex, self._name = identifiers.enchantments.resolve(data["name"])
         self._type = data["type"]
         self._level = data["level"]
 
@@ -169,6 +187,13 @@ class Enchantment:
     def level(self):
         return self._level
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Enchantment) and self._name == other._name \
+            and self._type == other._type and self._level == other._level
+
+    def __hash__(self) -> int:
+        return hash((self._name, self._type, self._level))
+
 
 class ItemStack:
     """
@@ -178,6 +203,7 @@ class ItemStack:
         aux: the aux identifier of the item -- the item variant
         enchantments: the enchantments on the item returned as an array of Enchantment instances
         typeId: the identifier in the form of namespace:item_name
+        typeIndex: the interned id of typeId in identifiers.items, None if the registry is full
         stackSize: the amount of the item
         maxStackSize: the max amount of items that this item can have
 
@@ -185,6 +211,7 @@ class ItemStack:
         aux: returns aux value
         enchantments: returns enchantments list
         typeId: returns the identifier
+        typeIndex: returns the interned id of the identifier
         stackSize: returns the stack size
         maxStackSize: returns the maxStackSize
 
@@ -192,7 +219,7 @@ class ItemStack:
     def __init__(self, data):
         self._aux = data["aux"]
         self._enchantments = [Enchantment(enchantment) for enchantment in data["enchantments"]]
-        self._typeId = f'{data["namespace"]}:{data["id"]}'
+        self._typeIndex, self._typeId = identifiers.items.resolve_namespaced(data["namespace"], data["id"])
         self._stackSize = data["stackSize"]
         self._maxStackSize = data["maxStackSize"]
 
@@ -208,6 +235,10 @@ class ItemStack:
     def typeId(self):
         return self._typeId
 
+    @property
+    def typeIndex(self) -> Optional[int]:
+        return self._typeIndex
+
     @property
     def stackSize(self):
         return self._stackSize
@@ -216,6 +247,14 @@ class ItemStack:
     def maxStackSize(self):
         return self._maxStackSize
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ItemStack) and self._typeId == other._typeId \
+            and self._aux == other._aux and self._stackSize == other._stackSize \
+            and self._enchantments == other._enchantments
+
+    def __hash__(self) -> int:
+        return hash((self._typeId, self._aux, self._stackSize))
+
 
 class Block:
     """
@@ -224,23 +263,35 @@ class Block:
     Attributes:
         aux: the variant of the block type
         typeId: the block type
+        typeIndex: the interned id of typeId in identifiers.blocks, None if the registry is full
 
     Methods:
         aux: returns the aux value
         typeId: returns the block name in the form of namespace:identifier
+        typeIndex: returns the interned id of the block name
     """
     def __init__(self, data):
         self._aux = data["aux"]
-        self._typeId = f'{data["namespace"]}:{data["id"]}'
+        self._typeIndex, self._typeId = identifiers.blocks.resolve_namespaced(data["namespace"], data["id"])
 
     @property
     def typeId(self) -> str:
         return self._typeId
 
+    @property
+    def typeIndex(self) -> Optional[int]:
+        return self._typeIndex
+
     @property
     def aux(self) -> int:
         return self._aux
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Block) and self._typeId == other._typeId and self._aux == other._aux
+
+    def __hash__(self) -> int:
+        return hash((self._typeId, self._aux))
+
 
 class Player:
     """
@@ -280,6 +331,12 @@ class Player:
     def position(self):
         return self._position
 
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Player) and self._id == other._id and self._name == other._name
+
+    def __hash__(self) -> int:
+        return hash((self._id, self._name))
+
     # to do: set dimension, set position, kill, give item, etc
 
 
@@ -357,8 +414,37 @@ class BlockBrokenContext(GameContext):
         return self._player
 
 
+class ChunkContext(GameContext):
+    """
+    A class representing the Game Context for the _ChunkLoaded, _ChunkUnloaded and _ChunkChanged game events.
+    This class inherits from Game Context
+
+    Methods:
+        dimension -> int: returns the dimension of the chunk, e.g., overworld would be 0
+        x -> int: returns the chunk x coordinate, None if the payload has none
+        z -> int: returns the chunk z coordinate, None if the payload has none
+    """
+    def __init__(self, data):
+        super().__init__(data)
+
+    @property
+    def dimension(self) -> int:
+        return self._data.get("dimension", 0)
+
+    @property
+    def x(self) -> int:
+        return self._data["chunkX"] if "chunkX" in self._data else self._data.get("x")
+
+    @property
+    def z(self) -> int:
+        return self._data["chunkZ"] if "chunkZ" in self._data else self._data.get("z")
+
+
 def getGameContext(name) -> type[GameContext]:
     return {
         "PlayerMessage": PlayerMessageContext,
-        "BlockBroken": BlockBrokenContext
+        "BlockBroken": BlockBrokenContext,
+        "_ChunkChanged_1.0.2": ChunkContext,
+        "_ChunkLoaded_1.0.2": ChunkContext,
+        "_ChunkUnloaded_1.0.2": ChunkContext
     }.get(name, GameContext)
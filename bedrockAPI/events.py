@@ -1,9 +1,17 @@
+from contextvars import ContextVar
 from typing import Callable, Dict
 
 
+# the BedrockCluster worker and websocket connection that sent the event being handled,
+# run_command called from its handlers defaults to them
+event_worker: ContextVar = ContextVar("event_worker", default=None)
+event_connection: ContextVar = ContextVar("event_connection", default=None)
+
+
 class EventManager:
     def __init__(self):
         self.event_handlers: Dict[str, Callable] = {}
+        self.watchdog = None  # watchdog.LoopWatchdog timing every dispatched handler when enabled
 
     def add_event_handler(self, event, handler):
         self.event_handlers[event] = handler
@@ -13,7 +21,10 @@ class EventManager:
 
     async def trigger_event(self, event_name, *args, **kwargs):
         if event_name in self.event_handlers:
-            await self.event_handlers[event_name](*args, **kwargs)
+            if self.watchdog is not None:
+                await self.watchdog.measure(event_name, self.event_handlers[event_name](*args, **kwargs))
+            else:
+                await self.event_handlers[event_name](*args, **kwargs)
 
 
 class GameEvent(EventManager): 
@@ -0,0 +1,79 @@
+from typing import Dict, List, Optional, Tuple
+
+
+class IdentifierRegistry:
+    """
+    A table of interned identifiers, each string is stored once and given a small integer id.
+
+    Contexts are created for every event so the same handful of block, item and enchantment
+    names would otherwise be rebuilt and stored over and over again. The registry hands
+    back the shared string and its index, so contexts share one copy of each name.
+
+    Entries are never removed and the names come from the client, so the registry is capped
+    at limit entries. Once full, unseen names get no index and are returned as plain strings,
+    so a modded or hostile client can not grow it without bound. Player names are not interned.
+
+    Params:
+        limit: the maximum number of interned names
+
+    Attributes:
+        _ids: maps an interned string to its integer id
+        _names: maps an integer id back to the interned string
+        _namespaced: cache of (namespace, id) pairs to their integer id
+        _limit: the maximum number of interned names
+
+    Methods:
+        intern: returns the integer id for a string, registering it if needed, None once full
+        intern_namespaced: returns the integer id for namespace:identifier without rebuilding the string
+        resolve: returns (id, name) for a string, the id is None and name a plain string once full
+        resolve_namespaced: returns (id, name) for namespace:identifier, like resolve
+        name: returns the interned string for an integer id
+        get: returns the integer id of a string or None if it has not been seen
+    """
+    def __init__(self, limit=4096):
+        self._ids: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._namespaced: Dict[Tuple[str, str], int] = {}
+        self._limit = limit
+
+    def intern(self, name: str) -> Optional[int]:
+        index = self._ids.get(name)
+        if index is None and len(self._names) < self._limit:
+            index = len(self._names)
+            self._names.append(name)
+            self._ids[name] = index
+        return index
+
+    def intern_namespaced(self, namespace: str, identifier: str) -> Optional[int]:
+        key = (namespace, identifier)
+        index = self._namespaced.get(key)
+        if index is None:
+            index = self.intern(f'{namespace}:{identifier}')
+            if index is not None:
+                self._namespaced[key] = index
+        return index
+
+    def resolve(self, name: str) -> Tuple[Optional[int], str]:
+        index = self.intern(name)
+        return index, name if index is None else self._names[index]
+
+    def resolve_namespaced(self, namespace: str, identifier: str) -> Tuple[Optional[int], str]:
+        index = self.intern_namespaced(namespace, identifier)
+        return index, f'{namespace}:{identifier}' if index is None else self._names[index]
+
+    def name(self, index: int) -> str:
+        return self._names[index]
+
+    def get(self, name: str):
+        return self._ids.get(name)
+
+    def __contains__(self, name) -> bool:
+        return name in self._ids
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+blocks = IdentifierRegistry()
+items = IdentifierRegistry()
+enchantments = IdentifierRegistry()
@@ -0,0 +1,213 @@
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger("bedrockAPI.watchdog")
+
+
+class SlowCall:
+    """
+    A record of a handler or command round trip that took longer than the watchdog threshold
+
+    Attributes:
+        label: the event name or command that was timed
+        duration: how long it took in seconds
+        stack: the stack sampled from the loop thread while it was blocked, or None if the loop never stalled
+        blocked: True if the loop was blocked while it ran, False if it was only waiting, e.g., on a command
+
+    Methods:
+        label, duration, stack, blocked: returns the attribute
+    """
+    def __init__(self, label, duration, stack):
+        self._label = label
+        self._duration = duration
+        self._stack = stack
+
+    @property
+    def blocked(self) -> bool:
+        return self._stack is not None
+
+    @property
+    def label(self) -> str:
+        return self._label
+
+    @property
+    def duration(self) -> float:
+        return self._duration
+
+    @property
+    def stack(self) -> Optional[str]:
+        return self._stack
+
+    def __str__(self) -> str:
+        reason = "blocking the event loop" if self.blocked else "awaiting, the event loop was not blocked"
+        return f"SlowCall: {self._label} took {self._duration * 1000:.1f}ms {reason}"
+
+
+class LoopWatchdog:
+    """
+    Opt-in monitor for the event loop, enabled with BedrockAPI.enable_watchdog
+
+    A task measures how late the loop wakes up from a fixed sleep (the loop lag). A cheap
+    callback refreshes a heartbeat every quarter threshold, as does entering measure, and a
+    background thread samples the stack of the loop thread whenever the heartbeat is older
+    than the threshold, which points at the handler blocking it. Dispatched handlers and
+    run_command round trips are timed through measure.
+
+    Params:
+        threshold: seconds after which a handler, command or loop stall is reported
+        interval: seconds between loop lag measurements
+
+    Attributes:
+        _lag: the most recent loop lag in seconds
+        _maxLag: the largest loop lag seen since start
+        _slowCalls: the most recent SlowCall records
+        _stalls: recent (time, stack) samples taken while the loop was blocked, guarded by _lock
+        _profile: folded stack counts collected while profiling, guarded by _lock
+        _heartbeat: the monotonic time the loop thread last ran a tick or entered measure
+        _monitorThread: the thread sampling the loop thread stack
+
+    Methods:
+        lag: returns the most recent loop lag
+        max_lag: returns the largest loop lag
+        slow_calls: returns the recorded SlowCall list
+        start: starts measuring, must be called from the loop thread
+        stop: stops measuring and profiling
+        measure: awaits a coroutine and records it if it exceeds the threshold
+        start_profile: starts sampling the loop thread stack
+        stop_profile: stops sampling and returns the folded stack counts
+        export_flamegraph: writes the folded stacks for flamegraph.pl / speedscope
+    """
+    def __init__(self, threshold=0.1, interval=0.5, history=100):
+        self._threshold = threshold
+        self._interval = interval
+        self._lag = 0.0
+        self._maxLag = 0.0
+        self._slowCalls: Deque[SlowCall] = collections.deque(maxlen=history)
+        self._stalls: Deque[Tuple[float, str]] = collections.deque(maxlen=history)
+        self._profile: Dict[str, int] = collections.Counter()
+        self._lock = threading.Lock()
+        self._monitorThread: Optional[threading.Thread] = None
+        self._loopThread: Optional[int] = None
+        self._heartbeat = time.monotonic()
+        self._lagTask: Optional[asyncio.Task] = None
+        self._tickHandle: Optional[asyncio.TimerHandle] = None
+        self._running = threading.Event()
+        self._profiling = threading.Event()
+        self._profileInterval = 0.005
+
+    @property
+    def lag(self) -> float:
+        return self._lag
+
+    @property
+    def max_lag(self) -> float:
+        return self._maxLag
+
+    @property
+    def slow_calls(self) -> List[SlowCall]:
+        return list(self._slowCalls)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._running.is_set():
+            return
+        self._loopThread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._running.set()
+        self._lagTask = loop.create_task(self._measureLag())
+        self._tick(loop)
+        self._monitorThread = threading.Thread(target=self._monitor, name="bedrockAPI-watchdog", daemon=True)
+        self._monitorThread.start()
+
+    def stop(self):
+        self._running.clear()
+        self._profiling.clear()
+        if self._lagTask is not None:
+            self._lagTask.cancel()
+            self._lagTask = None
+        if self._tickHandle is not None:
+            self._tickHandle.cancel()
+            self._tickHandle = None
+        if self._monitorThread is not None:
+            self._monitorThread.join()
+            self._monitorThread = None
+
+    def _tick(self, loop: asyncio.AbstractEventLoop):
+        self._heartbeat = time.monotonic()
+        self._tickHandle = loop.call_later(self._threshold / 4, self._tick, loop)
+
+    async def _measureLag(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self._interval)
+            self._lag = max(0.0, time.monotonic() - before - self._interval)
+            self._maxLag = max(self._maxLag, self._lag)
+            if self._lag > self._threshold:
+                logger.warning(f"Event loop lagged by {self._lag * 1000:.1f}ms")
+
+    def _sampleLoopStack(self) -> Optional[List[traceback.FrameSummary]]:
+        frame = sys._current_frames().get(self._loopThread)
+        if frame is None:
+            return None
+        return traceback.extract_stack(frame)
+
+    def _monitor(self):
+        reported = None
+        while self._running.is_set():
+            time.sleep(self._profileInterval if self._profiling.is_set() else self._threshold / 4)
+
+            stack = self._sampleLoopStack()
+            if stack is None:
+                continue
+
+            if self._profiling.is_set():
+                folded = ";".join(f"{f.name} ({f.filename}:{f.lineno})" for f in stack)
+                with self._lock:
+                    self._profile[folded] += 1
+
+            # the heartbeat only moves when the loop runs, so a stale one means a blocking call
+            heartbeat = self._heartbeat
+            if time.monotonic() - heartbeat > self._threshold and reported != heartbeat:
+                reported = heartbeat
+                with self._lock:
+                    self._stalls.append((time.monotonic(), "".join(traceback.format_list(stack))))
+
+    async def measure(self, label, coro):
+        start = self._heartbeat = time.monotonic()
+        try:
+            return await coro
+        finally:
+            end = time.monotonic()
+            duration = end - start
+            if duration > self._threshold:
+                with self._lock:
+                    stalls = list(self._stalls)
+                stack = next((s for t, s in reversed(stalls) if start <= t <= end), None)
+                slowCall = SlowCall(label, duration, stack)
+                self._slowCalls.append(slowCall)
+                logger.warning(str(slowCall) + (f"\n{stack}" if stack else ""))
+
+    def start_profile(self, interval=0.005):
+        with self._lock:
+            self._profile.clear()
+        self._profileInterval = interval
+        self._profiling.set()
+
+    def stop_profile(self) -> Dict[str, int]:
+        self._profiling.clear()
+        with self._lock:
+            return dict(self._profile)
+
+    def export_flamegraph(self, path):
+        with self._lock:
+            profile = dict(self._profile)
+        with open(path, "w") as file:
+            for stack, count in profile.items():
+                file.write(f"{stack} {count}\n")
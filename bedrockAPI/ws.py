@@ -2,9 +2,8 @@ import websockets
 import json
 import asyncio
 import sys
-import os
-import signal
 
+from typing import Dict, Optional, Set
 from uuid import uuid4
 
 from bedrockAPI.events import *
@@ -12,36 +11,136 @@ from bedrockAPI.events import *
 import bedrockAPI.consts as consts
 import bedrockAPI.utils as utils
 import bedrockAPI.context as context
+import bedrockAPI.watchdog as watchdog
+import bedrockAPI.chunks as chunks
 import logging
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+logger = logging.getLogger("bedrockAPI")
+
 
 class BedrockAPI:
     """
     Bedrock API for bridging the gap between python and Minecraft Bedrock Edition
+
+    Can be run blocking with start(), or embedded in a running event loop with
+    `async with BedrockAPI(...) as api: await api.serve()`.
+
+    Params:
+        host, port: the address the websocket server listens on
+        reuse_port: bind with SO_REUSEPORT, used by BedrockCluster workers
+        use_uvloop: run start() on a uvloop event loop, requires the uvloop package
     """
-    def __init__(self, host='localhost', port=8000):
+    def __init__(self, host='localhost', port=8000, reuse_port=False, use_uvloop=False):
+        if use_uvloop and uvloop is None:
+            raise ImportError("use_uvloop requires the uvloop package, install it with pip install uvloop")
+
         self._host = host
         self._port = port
+        self._reusePort = reuse_port
+        self._useUvloop = use_uvloop
         self._serverEvent = ServerEvent()
         self._gameEvent = GameEvent()
-        self._ws: websockets.WebSocketServerProtocol
-        self._loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()
+        self._ws: Optional[websockets.WebSocketServerProtocol] = None  # the most recent connection
+        self._connections: Dict[str, websockets.WebSocketServerProtocol] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         self._commandResponseFutures: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
         self._server = None
+        self._closed: Optional[asyncio.Event] = None  # set once shutdown has finished
+        self._bus = None  # cluster.BusClient when running as a BedrockCluster worker
+        self._watchdog = None
+        self._chunks = None
+        self._chatRouter = None  # chat_commands.ChatCommandRouter owning the PlayerMessage handler
+
+    @property
+    def worker(self):
+        """
+        The id of this BedrockCluster worker, None when not running in a cluster
+        """
+        return None if self._bus is None else self._bus.worker
+
+    @property
+    def connections(self) -> Dict[str, Optional[int]]:
+        """
+        The id of every open websocket connection mapped to the BedrockCluster worker that owns it,
+        the worker is None when not running in a cluster
+        """
+        if self._bus is not None:
+            return self._bus.connections
+        return {connection: None for connection in self._connections}
+
+    @property
+    def connected_workers(self):
+        """
+        The ids of the BedrockCluster workers that have a client connected, None when not running in a cluster
+        """
+        return None if self._bus is None else self._bus.connected_workers
 
     @property
     def loop(self):
+        """
+        The loop the API runs on: the running loop when first used from async code, otherwise a new loop for start()
+        """
+        if self._loop is None:
+            try:
+                self._loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._loop = uvloop.new_event_loop() if self._useUvloop else asyncio.new_event_loop()
         return self._loop
 
+    @property
+    def watchdog(self):
+        return self._watchdog
+
+    def enable_watchdog(self, threshold=0.1, interval=0.5):
+        """
+        Starts a LoopWatchdog that reports loop lag, and handlers or commands slower than threshold seconds.
+        Called before the server starts, the watchdog starts with it on whichever loop it runs on.
+        Safe to call while the server is running, use watchdog.start_profile / export_flamegraph to profile.
+        """
+        if self._watchdog is None:
+            self._watchdog = watchdog.LoopWatchdog(threshold, interval)
+            self._serverEvent.watchdog = self._watchdog
+            self._gameEvent.watchdog = self._watchdog
+            if self._server is not None:
+                self._loop.call_soon_threadsafe(self._watchdog.start, self._loop)
+        return self._watchdog
+
+    @property
+    def chunks(self):
+        return self._chunks
+
+    def track_chunks(self):
+        """
+        Subscribes to the chunk events on connect and keeps a ChunkTracker of loaded and changed chunks
+        """
+        if self._chunks is None:
+            self._chunks = chunks.ChunkTracker()
+        return self._chunks
+
     def __repr__(self):
         return f"Bedrock API running at {self._host}:{self._port}"
  
     async def _handleWS(self, ws: websockets.WebSocketServerProtocol) -> None:
+        connection = str(uuid4())
+        self._connections[connection] = ws
         self._ws = ws
         self._dispatchServerEvent("connect")
+        if self._bus is not None:
+            self._bus.announce(connection, True)
+
+        if self._chunks is not None:
+            for event in chunks.chunk_events:
+                self._createTask(self._subscribeEvent(event, ws=ws))
 
         try:
-            async for msg in self._ws:
+            async for msg in ws:
                 data = json.loads(msg)
 
                 header = data["header"]
@@ -57,7 +156,16 @@ class BedrockAPI:
                 elif header["messagePurpose"] == "event":
                     eventName = header["eventName"]
                     gameContext = context.getGameContext(eventName)(body)
-                    self._loop.create_task(self._gameEvent.trigger_event(eventName, gameContext))
+                    gameContext._worker = self.worker
+                    gameContext._connection = connection
+                    if self._chunks is not None and eventName in chunks.chunk_events:
+                        try:
+                            self._chunks.feed(eventName, gameContext)
+                        except Exception:
+                            logger.exception(f"Ignoring {eventName} event the chunk tracker could not read: {body}")
+                    self._createTask(self._dispatchGameEvent(eventName, gameContext))
+                    if self._bus is not None and self._bus.broadcast:
+                        self._bus.publish(eventName, body, connection)
 
                 else:
                     print(data)
@@ -67,18 +175,53 @@ class BedrockAPI:
         except asyncio.CancelledError:
             raise
         finally:
+            del self._connections[connection]
+            if self._ws is ws:
+                self._ws = next(reversed(self._connections.values()), None)
+            if self._bus is not None:
+                self._bus.announce(connection, False)
             if not ws.closed:
                 await ws.close()
 
 
-    async def _sendPayload(self, header, body):
+    async def _dispatchGameEvent(self, eventName, gameContext):
+        # runs in its own task, so the contextvars only route this handler's commands
+        event_worker.set(gameContext.worker)
+        event_connection.set(gameContext.connection)
+        await self._gameEvent.trigger_event(eventName, gameContext)
+
+    async def _sendPayload(self, header, body, ws=None):
+        ws = ws or self._ws
+        if ws is None:
+            raise Exception("No client is connected")
         data = json.dumps({
             "header": header,
             "body": body
         })
-        return await self._ws.send(data)
+        return await ws.send(data)
+
+    async def run_command(self, command, worker=None, connection=None):
+        """
+        Runs a command on a client. connection selects the client by id and, in a BedrockCluster, worker selects
+        the worker owning it. Inside an event handler both default to the client that sent the event,
+        otherwise to the most recent connection of this worker
+        """
+        if worker is None and connection is None:
+            worker, connection = event_worker.get(), event_connection.get()
+        if self._bus is not None:
+            if worker is None and connection is not None:
+                worker = self._bus.connections.get(connection)
+            if worker is not None and worker != self._bus.worker:
+                return await self._bus.run_command(command, worker, connection)
+
+        ws = self._ws
+        if connection is not None:
+            ws = self._connections.get(connection)
+            if ws is None:
+                raise Exception(f"Connection {connection} is closed")
+        if ws is None:
+            raise Exception("No client is connected")
 
-    async def run_command(self, command):
         requestId = str(uuid4())
         header = {
             "version": 1,
@@ -93,15 +236,22 @@ class BedrockAPI:
             "overworld": "default"
         }
 
-        response_future = asyncio.Future()
+        response_future = self.loop.create_future()
         self._commandResponseFutures[header["requestId"]] = response_future
 
-        await self._sendPayload(header, body)
+        try:
+            await self._sendPayload(header, body, ws)
+        except Exception:
+            del self._commandResponseFutures[requestId]
+            raise
+
+        if self._watchdog is not None:
+            return await self._watchdog.measure(f"run_command: {command}", response_future)
 
         future = await response_future
         return future
 
-    async def _subscribeEvent(self, event, unsubscribe=False):
+    async def _subscribeEvent(self, event, unsubscribe=False, ws=None):
         if event not in consts.game_events:
             raise Exception(f"Event: {event} not found in event list")
 
@@ -116,28 +266,97 @@ class BedrockAPI:
         body = {
             "eventName": event
         }
-        return await self._sendPayload(header, body)
-            
-    def start(self):
-        async def main():
-            print('WebSocket Server - running at')
-            print(f':: ws://localhost:{self._port}')
-            print(f':: /connect ws://{self._host}:{self._port}')
+        return await self._sendPayload(header, body, ws)
             
-            self._server = await websockets.serve(self._handleWS, self._host, self._port)
-            self._dispatchServerEvent("ready")
-            await self._server.wait_closed()
+    def _createTask(self, coro) -> asyncio.Task:
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def __aenter__(self):
+        await self._startServer()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.shutdown()
+
+    async def _startServer(self):
+        if self._server is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._closed = asyncio.Event()
+        if self._watchdog is not None:
+            self._watchdog.start(self._loop)
+
+        print('WebSocket Server - running at')
+        print(f':: ws://localhost:{self._port}')
+        print(f':: /connect ws://{self._host}:{self._port}')
+
+        self._server = await websockets.serve(self._handleWS, self._host, self._port,
+                                              reuse_port=self._reusePort or None)
+        self._dispatchServerEvent("ready")
+
+    async def serve(self):
+        """
+        Starts the websocket server on the running loop if needed, and waits until it is shut down
+        """
+        await self._startServer()
+        await self._closed.wait()
+
+    async def shutdown(self, timeout=5.0):
+        """
+        Gracefully stops the server: stops accepting connections, gives in-flight commands and
+        handler tasks up to timeout seconds to finish, cancels the rest and closes the sockets
+        """
+        if self._server is None:
+            return
+        server, self._server = self._server, None
+        deadline = self.loop.time() + timeout
+
+        server.server.close()  # stop accepting new connections, open ones stay up
+
+        pending = [*self._commandResponseFutures.values(), *self._tasks]
+        pending = [f for f in pending if f is not asyncio.current_task()]
+        if pending:
+            _, notDone = await asyncio.wait(pending, timeout=timeout)
+            for future in notDone:
+                future.cancel()
+
+        # closing handshakes with unresponsive clients could outlast the deadline
+        server.close()
+        try:
+            await asyncio.wait_for(server.wait_closed(), max(0.0, deadline - self.loop.time()))
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting for client connections to close")
+
+        # tasks created by events that arrived during the wait, or by the disconnects
+        leftover = [t for t in self._tasks if t is not asyncio.current_task()]
+        if leftover:
+            _, notDone = await asyncio.wait(leftover, timeout=max(0.0, deadline - self.loop.time()))
+            for task in notDone:
+                task.cancel()
+            await asyncio.gather(*notDone, return_exceptions=True)
+
+        for requestId, future in list(self._commandResponseFutures.items()):
+            if future.done():
+                del self._commandResponseFutures[requestId]
+
+        if self._watchdog is not None:
+            self._watchdog.stop()
+        self._closed.set()
 
-        if not self._loop.is_running():
-            self._server_task = self._loop.create_task(main())
-            self._loop.run_forever()
+    def start(self):
+        loop = self.loop
+        if not loop.is_running():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.serve())
         else:
-            asyncio.ensure_future(main(), loop=self._loop)
+            asyncio.run_coroutine_threadsafe(self.serve(), loop)
 
     def _dispatchServerEvent(self, event):
-        assert self._loop
         connectContext = ConnectContext(self._host, self._port)
-        self._loop.create_task(self._serverEvent.trigger_event(event, connectContext))
+        self._createTask(self._serverEvent.trigger_event(event, connectContext))
 
     def server_event(self, func=None):
         def decorator(event):
@@ -152,6 +371,8 @@ class BedrockAPI:
             event_name = utils.to_pascal_case(event.__name__)
             if event_name not in consts.game_events:
                 raise Exception(f"{event_name} not found in events")
+            if event_name == "PlayerMessage" and self._chatRouter is not None:
+                raise Exception("PlayerMessage is handled by a ChatCommandRouter, register it with router.message")
 
             self._gameEvent.add_event_handler(event_name, event)
             return event
@@ -163,34 +384,32 @@ class BedrockAPI:
 
     def remove_game_event(self, event):
         self._gameEvent.remove_event_handler(event)
-        self._loop.create_task(self._subscribeEvent(event, unsubscribe=True))
-
+        if event == "PlayerMessage":
+            self._chatRouter = None
+        self._createTask(self._subscribeEvent(event, unsubscribe=True))
 
-    def stop(self):
-        async def shutdown():
-            if self._server is not None:
-                # Forcibly close all active WebSocket connections
-                for ws in self._server.websockets.copy():
-                    ws.transport.close()  # Immediately close the transport (socket)
-                
-                # Now close the server itself
-                self._server.close()
-                await self._server.wait_closed()
 
-            await self._loop.shutdown_asyncgens()
+    def stop(self, timeout=5.0):
+        """
+        Shuts the server down from any thread, blocking until it is closed unless called from the loop itself
+        """
+        if self._server is None:
+            return
 
-        if self._loop.is_running():
-            # Schedule the shutdown task and forcibly stop the loop
-            asyncio.ensure_future(shutdown(), loop=self._loop)
+        loop = self.loop
+        if not loop.is_running():
+            loop.run_until_complete(self.shutdown(timeout))
+            return
 
-            print('Terminating the event loop')
-            os.kill(os.getpid(), signal.SIGTERM)  # Terminate the process immediately
+        try:
+            runningLoop = asyncio.get_running_loop()
+        except RuntimeError:
+            runningLoop = None
 
+        if runningLoop is loop:
+            self._createTask(self.shutdown(timeout))
         else:
-            # If the loop is not running, just run the shutdown coroutine directly
-            asyncio.run(shutdown())
-
-
+            asyncio.run_coroutine_threadsafe(self.shutdown(timeout), loop).result()
 
 
 if __name__ == '__main__':
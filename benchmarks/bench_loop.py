@@ -0,0 +1,104 @@
+"""
+Compares BedrockAPI throughput on the default asyncio loop and on uvloop.
+
+A fake client connects over a real websocket, fires PlayerMessage events at the server
+and answers run_command requests, the way a Minecraft client would.
+
+Usage:
+    python benchmarks/bench_loop.py [--events 20000] [--commands 5000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bedrockAPI import BedrockAPI  # noqa: E402
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+EVENT = json.dumps({
+    "header": {"eventName": "PlayerMessage", "messagePurpose": "event", "version": 17039360},
+    "body": {"message": "a", "receiver": "", "sender": "Test", "type": "chat"}
+})
+
+
+async def client(port, events, commandsDone):
+    async with websockets.connect(f"ws://localhost:{port}") as ws:
+        for _ in range(events):
+            await ws.send(EVENT)
+
+        async for msg in ws:
+            header = json.loads(msg)["header"]
+            await ws.send(json.dumps({
+                "header": {"messagePurpose": "commandResponse", "requestId": header["requestId"]},
+                "body": {"message": "ok", "statusCode": 0}
+            }))
+            if commandsDone.is_set():
+                break
+
+
+async def bench(port, events, commands):
+    received = 0
+    allReceived = asyncio.Event()
+    commandsDone = asyncio.Event()
+
+    async with BedrockAPI(port=port) as api:
+        @api.game_event
+        async def player_message(ctx):
+            nonlocal received
+            received += 1
+            if received == events:
+                allReceived.set()
+
+        start = time.perf_counter()
+        clientTask = asyncio.create_task(client(port, events, commandsDone))
+        await allReceived.wait()
+        eventTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(commands - 1):
+            await api.run_command("say hi")
+        commandsDone.set()
+        await api.run_command("say hi")
+        commandTime = time.perf_counter() - start
+
+        await clientTask
+
+    return events / eventTime, commands / commandTime
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--commands", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8123)
+    args = parser.parse_args()
+
+    loops = {"asyncio": asyncio.new_event_loop}
+    if uvloop is not None:
+        loops["uvloop"] = uvloop.new_event_loop
+    else:
+        print("uvloop not installed, only benchmarking the default loop")
+
+    for name, newLoop in loops.items():
+        loop = newLoop()
+        asyncio.set_event_loop(loop)
+        try:
+            eventRate, commandRate = loop.run_until_complete(bench(args.port, args.events, args.commands))
+        finally:
+            loop.close()
+        print(f"{name:>8}: {eventRate:10.0f} events/s {commandRate:10.0f} commands/s")
+
+
+if __name__ == '__main__':
+    main()